@@ -69,6 +69,66 @@ def shift_gram(shift, T, out):
     return out
 
 
+@numba.jit(nopython=True, cache=True)
+def weighted_shift_gram(shifts, weights, T, out):
+    """
+    Computes sum_i weights[i] * shift_gram(shifts[i], T) in upper form.
+
+    Each term is constant along index ranges of the diagonal and first
+    off-diagonal, so the sum is accumulated as difference arrays. This
+    takes O(len(shifts) + T) operations rather than O(len(shifts) * T).
+    """
+    out.fill(0.0)
+    diag = np.zeros(T + 1)
+    off_d = np.zeros(T + 1)
+
+    for i in range(shifts.size):
+        shift, a = shifts[i], weights[i]
+
+        # Terms of shift_gram(...) are constant on [lo, hi), or on this
+        # range offset by one element. Clamped edge is handled separately.
+        if shift > 0:
+            d, r = int(shift), (shift % 1)
+            lo, hi, sgn = 0, T - d - 1, 1
+            diag[0] += a * (d + 1)
+            diag[1] -= a * (d + 1)
+        elif shift < 0:
+            d, r = int(-shift), ((-shift) % 1)
+            lo, hi, sgn = d + 1, T, -1
+            diag[T - 1] += a * (d + 1)
+            diag[T] -= a * (d + 1)
+        else:
+            diag[0] += a
+            diag[T] -= a
+            continue
+
+        if hi > lo:
+            z1 = a * (1 - r) ** 2
+            z2 = a * r ** 2
+            z3 = a * r * (1 - r)
+
+            diag[lo] += z2
+            diag[hi] -= z2
+
+            diag[lo + sgn] += z1
+            diag[hi + sgn] -= z1
+
+            # Off-diagonal terms are offset by one only for positive shifts.
+            o = 1 if shift > 0 else 0
+            off_d[lo + o] += z3
+            off_d[hi + o] -= z3
+
+    # Integrate difference arrays.
+    sd, so = 0.0, 0.0
+    for t in range(T):
+        sd += diag[t]
+        so += off_d[t]
+        out[-1, t] = sd
+        out[-2, t] = so
+
+    return out
+
+
 @numba.jit(nopython=True, cache=True)
 def apply_shift(x, shift, out):
     """
@@ -114,6 +174,73 @@ def apply_shift(x, shift, out):
     return out
 
 
+@numba.jit(nopython=True, cache=True)
+def shift_dots(x, shift, y):
+    """
+    Computes the dot products of apply_shift(x, shift, ...) with `y` and
+    with itself, without storing the shifted vector.
+
+    Parameters
+    ----------
+    x : ndarray
+        Vector holding data.
+    shift : float
+        Shift magnitude.
+    y : ndarray
+        Vector with the same length as x.
+
+    Returns
+    -------
+    xy : float
+        Dot product of shifted x with y.
+    xx : float
+        Squared norm of shifted x.
+    """
+
+    T = len(y)
+    xy, xx = 0.0, 0.0
+
+    if shift > 0:
+        d = int(shift // 1)
+        r = shift % 1
+        for t in range(T):
+            j = t - d
+            if j <= 0:
+                xs = x[0]
+            else:
+                xs = x[j] * (1 - r) + x[j - 1] * r
+            xy += xs * y[t]
+            xx += xs * xs
+    elif shift < 0:
+        d = int((-shift) // 1)
+        r = (-shift) % 1
+        for t in range(T):
+            j = t - d
+            if j <= 0:
+                xs = x[-1]
+            else:
+                xs = x[-j-1] * (1 - r) + x[-j] * r
+            xy += xs * y[-t-1]
+            xx += xs * xs
+    else:
+        for t in range(T):
+            xy += x[t] * y[t]
+            xx += x[t] * x[t]
+
+    return xy, xx
+
+
+@numba.jit(nopython=True, cache=True)
+def apply_shift_batch(x, shifts, out):
+    """
+    Translates `x` by each element of `shifts`, storing the
+    j-th result in out[j].
+    """
+    for j in range(shifts.size):
+        apply_shift(x, shifts[j], out[j])
+    return out
+
+
 @numba.jit(nopython=True, cache=True)
 def trans_shift(x, shift, out):
     out.fill(0.0)
@@ -108,6 +108,53 @@ def apply_shift(x, shift, out):
     return out
 
 
+@numba.jit(nopython=True, cache=True)
+def shift_dots(x, shift, y):
+    """
+    Computes the dot products of apply_shift(x, shift, ...) with `y` and
+    with itself, without storing the shifted vector.
+    """
+
+    T = y.shape[0]
+    xy, xx = 0.0, 0.0
+
+    if shift > 0:
+        d = int(shift // 1)
+        r = shift % 1
+        for t in range(T):
+            j = t - d
+            xs = x[j] * (1 - r) + x[j - 1] * r
+            xy += xs * y[t]
+            xx += xs * xs
+
+    elif shift < 0:
+        d = int((-shift) // 1)
+        r = (-shift) % 1
+        for t in range(T):
+            j = t - d + 1
+            xs = x[-j] * (1 - r) + x[-j + 1] * r
+            xy += xs * y[-t - 1]
+            xx += xs * xs
+
+    else:
+        for t in range(T):
+            xy += x[t] * y[t]
+            xx += x[t] * x[t]
+
+    return xy, xx
+
+
+@numba.jit(nopython=True, cache=True)
+def apply_shift_batch(x, shifts, out):
+    """
+    Translates `x` by each element of `shifts`, storing the
+    j-th result in out[j].
+    """
+    for j in range(shifts.size):
+        apply_shift(x, shifts[j], out[j])
+    return out
+
+
 @numba.jit(nopython=True, cache=True)
 def trans_shift(x, shift, out):
 
@@ -18,8 +18,17 @@ from tensortools.cpwarp import periodic_shifts
 # with numba.__version__ == "0.46.0".
 USE_PARALLEL = True
 
+# Fast-math flags for arithmetic-heavy kernels, allowing reductions to
+# be vectorized and contracted into FMAs. The "nnan" and "ninf" flags
+# are left out, since infinities are used as sentinel values.
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+
+# Number of partial sums used by parallel reductions. Fixing this, rather
+# than using the number of threads, keeps results independent of the
+# thread count and lets numba cache the compiled kernels.
+N_CHUNKS = 32
+
 
-@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL)
 def fit_shift_cp2(
         X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter=10,
         max_iter=1000, tol=1e-4, warp_iterations=10,
@@ -43,6 +52,61 @@ def fit_shift_cp2(
     the shift parameters.
     """
 
+    # Hot loops assume C-contiguous, double precision arrays. Factors
+    # and shifts are updated in place, so these are only copied if needed.
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    u, v, w, u_s, v_s = [
+        np.ascontiguousarray(a, dtype=np.float64)
+        for a in (u, v, w, u_s, v_s)]
+    mask = np.ascontiguousarray(mask, dtype=bool)
+
+    # Dispatch to a version compiled for the chosen boundary condition.
+    if periodic:
+        impl = _fit_shift_cp2_periodic
+    else:
+        impl = _fit_shift_cp2_padded
+
+    return impl(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, patience)
+
+
+@numba.jit(nopython=True, cache=True)
+def _fit_shift_cp2_periodic(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, patience):
+    return _fit_shift_cp2(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, True, patience)
+
+
+@numba.jit(nopython=True, cache=True)
+def _fit_shift_cp2_padded(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, patience):
+    return _fit_shift_cp2(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, False, patience)
+
+
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _fit_shift_cp2(
+        X, Xnorm, rank, u, v, w, u_s, v_s, mask, min_iter,
+        max_iter, tol, warp_iterations, max_shift_axis0,
+        max_shift_axis1, u_nonneg, v_nonneg, periodic, patience):
+    """
+    Implements fit_shift_cp2(...). The shims above pass `periodic` as a
+    compile-time constant, so this function and the kernels it calls are
+    compiled separately for each boundary condition, with the branches
+    on `periodic` removed.
+    """
+
     # Problem dimensions, norm of data.
     N, K, T = X.shape
     Xest = np.empty_like(X)
@@ -58,14 +122,42 @@ def fit_shift_cp2(
 
     # Preallocated space for intermediate computations
     WtW = np.empty((2, T))
-    _WtW = np.empty((2, T))
     Ww = np.empty(T)
     rhs = np.empty(T)
 
+    # Holds total shift, u_s[r, n] + v_s[r, k], for the current component.
+    S = np.empty((N, K))
+
+    # Hold Z[n, k] @ Ww and Ww @ Ww, where Ww is w[r] shifted by S[n, k].
+    # These are shared by the updates of u[r] and v[r].
+    zw = np.empty((N, K))
+    ww = np.empty((N, K))
+
+    # Holds the residual tensor excluding a single component.
+    Z = np.empty_like(X)
+
+    # Single precision copies of Z and w[r], used by the random search
+    # over shifts. Only the ranking of candidate shifts depends on these,
+    # which tolerates rounding error, and halving the bytes read doubles
+    # the SIMD width of the search.
+    Z32 = np.empty(X.shape, dtype=np.float32)
+    w32 = np.empty(T, dtype=np.float32)
+
+    # Scratch space for the kernels called inside parallel loops. These
+    # split their work into at most N_CHUNKS chunks, each with its own
+    # row, so that nothing is allocated in the hot loops.
+    wshift_bufs = np.empty((N_CHUNKS, T))
+    search_bufs = np.empty((N_CHUNKS, 3, warp_iterations))
+    Ww_bufs = np.empty((N_CHUNKS, warp_iterations, T), dtype=np.float32)
+
     # Set up progress bar.
     itercount = 0
     loss = np.nan
 
+    # Initial model estimate. This is updated incrementally as each
+    # component changes, rather than recomputed for every update.
+    predict(u, v, w, u_s, v_s, periodic, Xest)
+
     # === main loop === #
     converged = False
 
@@ -76,300 +168,468 @@ def fit_shift_cp2(
         # elif verbose:
         #     print("Starting iterations....")
 
-        # Update groups of parameters in random order.
-        for z in npr.permutation(rank * 5):
+        # Update components in random order.
+        for r in npr.permutation(rank):
 
-            # Update component r.
-            r = z // 5
+            # Remove component r from the model estimate. The residual
+            # does not depend on component r, so it is computed once and
+            # shared by all updates of this component.
+            _predict_one(
+                r, u, v, w, u_s, v_s, periodic, -1.0, Xest, wshift_bufs)
+            np.subtract(X, Xest, Z)
+            _component_shifts(u_s[r], v_s[r], S)
+            dots_valid = False
+            z32_valid = False
 
-            # Update one of the low-rank factors or shifts.
-            q = z % 5
+            # Update low-rank factors and shifts in random order.
+            for q in npr.permutation(5):
 
-            # Update residual tensor.
-            predict(
-                u, v, w, u_s, v_s, periodic, Xest, skip_dim=r)
-            Z = X - Xest
+                # === UPDATE FACTOR WEIGHTS FOR AXIS 0 === #
+                if q == 0:
 
-            # === UPDATE FACTOR WEIGHTS FOR AXIS 0 === #
-            if q == 0:
+                    # Dot products of residuals with shifted w[r].
+                    if not dots_valid:
+                        _shifted_dots(Z, w[r], S, periodic, zw, ww)
+                        dots_valid = True
 
-                if periodic:
-                    for n in range(N):
+                    # Solve for all elements of u[r] at once.
+                    u[r] = (zw @ v[r]) / (ww @ (v[r] * v[r]))
 
-                        num, denom = 0.0, 0.0
+                    # If u is all negative, flip sign of temporal factor.
+                    if u[r].max() < 0.0:
+                        np.negative(u[r], u[r])
+                        np.negative(w[r], w[r])
+                        np.negative(zw, zw)
 
-                        for k in range(K):
-                            # shift w[r], store result in Ww.
-                            periodic_shifts.apply_shift(
-                                w[r], u_s[r, n] + v_s[r, k], Ww)
-                            num += v[r, k] * (Z[n, k] @ Ww)
-                            denom += v[r, k] * v[r, k] * (Ww @ Ww)
+                    # Project u onto nonnegative orthant.
+                    if u_nonneg:
+                        u[r] = np.maximum(0, u[r])
+                    _prevent_zeros(u[r])
 
-                        u[r, n] = num / denom
+                # === UPDATE FACTOR WEIGHTS FOR AXIS 1 === #
+                elif q == 1:
 
-                else:
-                    for n in range(N):
+                    # Dot products of residuals with shifted w[r].
+                    if not dots_valid:
+                        _shifted_dots(Z, w[r], S, periodic, zw, ww)
+                        dots_valid = True
 
-                        num, denom = 0.0, 0.0
+                    # Solve for all elements of v[r] at once.
+                    v[r] = (u[r] @ zw) / ((u[r] * u[r]) @ ww)
 
-                        for k in range(K):
-                            # shift w[r], store result in Ww.
-                            padded_shifts.apply_shift(
-                                w[r], u_s[r, n] + v_s[r, k], Ww)
-                            num += v[r, k] * (Z[n, k] @ Ww)
-                            denom += v[r, k] * v[r, k] * (Ww @ Ww)
+                    # If v is all negative, flip sign of temporal factor.
+                    if v[r].max() < 0.0:
+                        np.negative(v[r], v[r])
+                        np.negative(w[r], w[r])
+                        np.negative(zw, zw)
 
-                        u[r, n] = num / denom
+                    # Project v onto nonnegative orthant.
+                    if v_nonneg:
+                        v[r] = np.maximum(0, v[r])
+                    _prevent_zeros(v[r])
 
-                # If u is all negative, flip sign of temporal factor.
-                if np.all(u[r] < 0):
-                    u[r] = -u[r]
-                    w[r] = -w[r]
+                # === UPDATE AXIS WEIGHTS FOR AXIS 2 (temporal factors) === #
+                elif q == 2:
 
-                # Project u onto nonnegative orthant.
-                if u_nonneg:
-                    u[r] = np.maximum(0, u[r])
-                _prevent_zeros(u[r])
+                    # Periodic boundary condition.
+                    if periodic:
 
-            # === UPDATE FACTOR WEIGHTS FOR AXIS 1 === #
-            elif q == 1:
+                        # Holds diagonal and off diagonal of gram matrix.
+                        d, off_d = 0.0, 0.0
 
-                if periodic:
-                    for k in range(K):
+                        for n in range(N):
+                            for k in range(K):
+
+                                # Shift and weighting factor.
+                                shift = S[n, k]
+                                u_v = u[r, n] * v[r, k]
+                                u_v2 = u_v * u_v
+
+                                # Contribution to gram matrix.
+                                _d, _off_d = periodic_shifts.shift_gram(shift)
+                                d += u_v2 * _d
+                                off_d += u_v2 * _off_d
+
+                        # Right hand side of normal equations.
+                        _temporal_rhs(Z, u[r], v[r], S, periodic, rhs)
+
+                        # Update w[r] by tridiagonal, circulant solver.
+                        periodic_shifts.rojo_solve(d, off_d, rhs, w[r], Ww)
+
+                    # Padded boundary condition.
+                    else:
+
+                        # Holds gram matrix, summing the contributions of
+                        # all (n, k) with weights (u[r, n] * v[r, k]) ** 2.
+                        padded_shifts.weighted_shift_gram(
+                            S.ravel(), np.outer(u[r] ** 2, v[r] ** 2).ravel(),
+                            T, WtW)
+                        WtW[-1] += 1e-8
+
+                        # Right hand side of normal equations.
+                        _temporal_rhs(Z, u[r], v[r], S, periodic, rhs)
+
+                        # Bound Lipshitz constant by Gersgorin Circle Theorem
+                        L = max(WtW[1, 0] + WtW[0, 1], WtW[1, -1] + WtW[0, -1])
+                        for i in range(1, T - 1):
+                            Li = WtW[1, i] + WtW[0, i] + WtW[0, i + 1]
+                            if Li > L:
+                                L = Li
+
+                        # Update temporal factor by gradient descent.
+                        ss = 0.95 / L
+                        for itr in range(10):
+
+                            # Update gradient with banded matrix multiply.
+                            ug = padded_shifts.sym_bmat_mul(WtW, w[r], Ww)
+                            grad = ug - rhs
+
+                            # Gradient descent step.
+                            for t in range(T):
+                                w[r, t] = max(0.0, w[r, t] - ss * grad[t])
+
+                    dots_valid = False
+
+                # === UPDATE SHIFT PARAMS FOR AXIS 0 === #
+                elif (q == 3) and (itercount > 0):
+                    if not z32_valid:
+                        Z32[:] = Z
+                        z32_valid = True
+                    w32[:] = w[r]
+                    n_chunks = min(N_CHUNKS, N)
+                    for c in numba.prange(n_chunks):
+                        for n in range((c * N) // n_chunks,
+                                       ((c + 1) * N) // n_chunks):
+                            u_s[r, n] = _fit_shift(
+                                Z32[n], u[r, n], v[r], v_s[r], w32,
+                                max_shift_axis0 * T, periodic,
+                                warp_iterations, u_s[r, n],
+                                Ww_bufs[c], search_bufs[c])
+                    _component_shifts(u_s[r], v_s[r], S)
+                    dots_valid = False
+
+                # === UPDATE SHIFT PARAMS FOR AXIS 1 === #
+                elif (q == 4) and (itercount > 0):
+                    if not z32_valid:
+                        Z32[:] = Z
+                        z32_valid = True
+                    w32[:] = w[r]
+                    n_chunks = min(N_CHUNKS, K)
+                    for c in numba.prange(n_chunks):
+                        for k in range((c * K) // n_chunks,
+                                       ((c + 1) * K) // n_chunks):
+                            v_s[r, k] = _fit_shift(
+                                Z32[:, k], v[r, k], u[r], u_s[r], w32,
+                                max_shift_axis1 * T, periodic,
+                                warp_iterations, v_s[r, k],
+                                Ww_bufs[c], search_bufs[c])
+                    _component_shifts(u_s[r], v_s[r], S)
+                    dots_valid = False
+
+            # Add updated component r back into the model estimate.
+            _predict_one(
+                r, u, v, w, u_s, v_s, periodic, 1.0, Xest, wshift_bufs)
 
-                        num, denom = 0.0, 0.0
+        # Update masked entries, if applicable.
+        if masked:
+            _fill_masked(X, Xest, mask)
 
-                        for n in range(N):
-                            # shift w[r], store result in Ww.
-                            periodic_shifts.apply_shift(
-                                w[r], u_s[r, n] + v_s[r, k], Ww)
-                            num += u[r, n] * (Z[n, k] @ Ww)
-                            denom += u[r, n] * u[r, n] * (Ww @ Ww)
+        # Test for convergence.
+        itercount += 1
+        loss = _residual_norm(X, Xest) / Xnorm
+        loss_hist.append(loss)
 
-                        v[r, k] = num / denom
+        # Break loop if converged.
+        if itercount > min_iter:
+            converged = abs(loss_hist[-patience] - loss_hist[-1]) < tol
 
-                else:
-                    for k in range(K):
+    return u, v, w, u_s, v_s, loss_hist
 
-                        num, denom = 0.0, 0.0
 
-                        for n in range(N):
-                            # shift w[r], store result in Ww.
-                            padded_shifts.apply_shift(
-                                w[r], u_s[r, n] + v_s[r, k], Ww)
-                            num += u[r, n] * (Z[n, k] @ Ww)
-                            denom += u[r, n] * u[r, n] * (Ww @ Ww)
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def predict(u, v, w, u_s, v_s, periodic, result, skip_dim=-1):
 
-                        v[r, k] = num / denom
+    N, K, T = result.shape
+    rank = u.shape[0]
+    result.fill(0.0)
 
-                # If v is all negative, flip sign of temporal factor.
-                if np.all(v[r] < 0):
-                    v[r] = -v[r]
-                    w[r] = -w[r]
+    for k in numba.prange(K):
 
-                # Project v onto nonnegative orthant.
-                if v_nonneg:
-                    v[r] = np.maximum(0, v[r])
-                _prevent_zeros(v[r])
+        # Holds shifted temporal factor, allocated once per k.
+        wshift = np.empty(T)
 
-            # === UPDATE AXIS WEIGHTS FOR AXIS 2 (temporal factors) === #
-            elif q == 2:
+        for n in range(N):
+            for r in range(rank):
+
+                if r == skip_dim:
+                    continue
+
+                shift = u_s[r, n] + v_s[r, k]
 
-                # Periodic boundary condition.
                 if periodic:
+                    periodic_shifts.apply_shift(w[r], shift, wshift)
+                else:
+                    padded_shifts.apply_shift(w[r], shift, wshift)
 
-                    # Holds diagonal and off diagonal of gram matrix.
-                    d, off_d = 0.0, 0.0
+                coef = u[r, n] * v[r, k]
+                for t in range(T):
+                    result[n, k, t] += coef * wshift[t]
 
-                    # Holds right hand side of normal equations.
-                    rhs.fill(0.0)
+    return result
 
-                    for n in range(N):
-                        for k in range(K):
 
-                            # Shift and weighting factor.
-                            shift = u_s[r, n] + v_s[r, k]
-                            u_v = u[r, n] * v[r, k]
-                            u_v2 = u_v * u_v
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _predict_one(
+        r, u, v, w, u_s, v_s, periodic, scale, result, wshift_bufs):
+    """
+    Adds `scale` times the prediction of component r to `result`. Axis 1
+    is split into at most len(wshift_bufs) chunks, each holding the
+    shifted temporal factor in its own row of `wshift_bufs`.
+    """
 
-                            # Contribution to gram matrix.
-                            _d, _off_d = periodic_shifts.shift_gram(shift)
-                            d += u_v2 * _d
-                            off_d += u_v2 * _off_d
+    N, K, T = result.shape
+    n_chunks = min(wshift_bufs.shape[0], K)
 
-                            # Contribution to right hand side.
-                            rhs += u_v * periodic_shifts.trans_shift(
-                                Z[n, k], shift, Ww)
+    for c in numba.prange(n_chunks):
+        wshift = wshift_bufs[c]
+        for k in range((c * K) // n_chunks, ((c + 1) * K) // n_chunks):
+            for n in range(N):
 
-                    # Update temporal factor w[r] by tridiag, circulant solver.
-                    periodic_shifts.rojo_solve(d, off_d, rhs, w[r], Ww)
+                shift = u_s[r, n] + v_s[r, k]
 
-                # Padded boundary condition.
+                if periodic:
+                    periodic_shifts.apply_shift(w[r], shift, wshift)
                 else:
+                    padded_shifts.apply_shift(w[r], shift, wshift)
 
-                    # Holds gram matrix.
-                    WtW.fill(0.0)
-                    WtW[-1] += 1e-8
-
-                    # Holds right hand side of normal equations.
-                    rhs.fill(0.0)
-
-                    for n in range(N):
-                        for k in range(K):
-                            # Shift and weighting factor.
-                            shift = u_s[r, n] + v_s[r, k]
-                            u_v = u[r, n] * v[r, k]
-                            u_v2 = u_v * u_v
-
-                            # Contribution to gram matrix.
-                            WtW += u_v2 * \
-                                padded_shifts.shift_gram(shift, T, _WtW)
-
-                            # Contribution to right hand side.
-                            rhs += u_v * padded_shifts.trans_shift(
-                                Z[n, k], shift, Ww)
-
-                    # Bound Lipshitz constant by Gersgorin Circle Theorem
-                    L = max(WtW[1, 0] + WtW[0, 1], WtW[1, -1] + WtW[0, -1])
-                    for i in range(1, T - 1):
-                        Li = WtW[1, i] + WtW[0, i] + WtW[0, i + 1]
-                        if Li > L:
-                            L = Li
-
-                    # Update temporal factor by gradient descent.
-                    ss = 0.95 / L
-                    for itr in range(10):
-
-                        # Update gradient with banded matrix multiply.
-                        ug = padded_shifts.sym_bmat_mul(WtW, w[r], Ww)
-                        grad = ug - rhs
-
-                        # Gradient descent step.
-                        for t in range(T):
-                            w[r, t] = max(0.0, w[r, t] - ss * grad[t])
-
-            # === UPDATE SHIFT PARAMS FOR AXIS 0 === #
-            elif (q == 3) and (itercount > 0):
-                for n in numba.prange(N):
-                    u_s[r, n] = _fit_shift(
-                        Z[n], u[r, n], v[r], v_s[r], w[r],
-                        max_shift_axis0 * T, periodic,
-                        warp_iterations, u_s[r, n], Ww)
-
-            # === UPDATE SHIFT PARAMS FOR AXIS 1 === #
-            elif (q == 4) and (itercount > 0):
-                for k in numba.prange(K):
-                    v_s[r, k] = _fit_shift(
-                        Z[:, k], v[r, k], u[r], u_s[r], w[r],
-                        max_shift_axis1 * T, periodic,
-                        warp_iterations, v_s[r, k], Ww)
-
-        # Update model estimate for convergence check.
-        predict(
-            u, v, w, u_s, v_s, periodic, Xest)
+                coef = scale * u[r, n] * v[r, k]
+                for t in range(T):
+                    result[n, k, t] += coef * wshift[t]
 
-        # Update masked entries, if applicable.
-        if masked:
-            for n in range(N):
-                for k in range(K):
-                    for t in range(T):
-                        if not mask[n, k, t]:
-                            X[n, k, t] = Xest[n, k, t]
+    return result
 
-        # Test for convergence.
-        itercount += 1
-        loss = np.linalg.norm((X - Xest).ravel()) / Xnorm
-        loss_hist.append(loss)
 
-        # Break loop if converged.
-        if itercount > min_iter:
-            converged = abs(loss_hist[-patience] - loss_hist[-1]) < tol
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _shifted_dots(Z, w, S, periodic, zw, ww):
+    """
+    Shifts `w` by S[n, k] for every (n, k) and stores the dot products
+    Z[n, k] @ Ww in zw[n, k] and Ww @ Ww in ww[n, k].
+    """
 
-    return u, v, w, u_s, v_s, loss_hist
+    N, K, _ = Z.shape
 
+    # The shifted vector is never stored, so the T-length working set is
+    # only w and the current row of Z.
+    for n in numba.prange(N):
+        for k in range(K):
+            if periodic:
+                zw[n, k], ww[n, k] = periodic_shifts.shift_dots(
+                    w, S[n, k], Z[n, k])
+            else:
+                zw[n, k], ww[n, k] = padded_shifts.shift_dots(
+                    w, S[n, k], Z[n, k])
 
-@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL)
-def predict(u, v, w, u_s, v_s, periodic, result, skip_dim=-1):
+    return zw, ww
 
-    N, K, T = result.shape
-    rank = u.shape[0]
-    result.fill(0.0)
 
-    for k in numba.prange(K):
-        for n in range(N):
-            for r in range(rank):
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _temporal_rhs(Z, u, v, S, periodic, rhs):
+    """
+    Stores the right hand side of the normal equations for the temporal
+    factor, sum over (n, k) of u[n] * v[k] * trans_shift(Z[n, k], S[n, k]),
+    in `rhs`.
+    """
 
-                if r == skip_dim:
-                    continue
+    N, K, T = Z.shape
 
-                shift = u_s[r, n] + v_s[r, k]
+    # Split axis 0 into chunks, each accumulating into its own row
+    # of `partial`.
+    n_chunks = min(N_CHUNKS, N)
+    partial = np.zeros((n_chunks, T))
+
+    for c in numba.prange(n_chunks):
+        Zt = np.empty(T)
+        for n in range((c * N) // n_chunks, ((c + 1) * N) // n_chunks):
+            for k in range(K):
 
                 if periodic:
-                    wshift = periodic_shifts.apply_shift(
-                        w[r], shift, np.empty(T))
+                    periodic_shifts.trans_shift(Z[n, k], S[n, k], Zt)
                 else:
-                    wshift = padded_shifts.apply_shift(
-                        w[r], shift, np.empty(T))
+                    padded_shifts.trans_shift(Z[n, k], S[n, k], Zt)
 
+                u_v = u[n] * v[k]
                 for t in range(T):
-                    result[n, k, t] += wshift[t] * u[r, n] * v[r, k]
+                    partial[c, t] += u_v * Zt[t]
 
-    return result
+    for t in range(T):
+        rhs[t] = 0.0
+        for c in range(n_chunks):
+            rhs[t] += partial[c, t]
+
+    return rhs
+
+
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _fill_masked(X, Xest, mask):
+    """Overwrites entries of X where mask is False with entries of Xest."""
+
+    X_flat = X.reshape(-1)
+    Xest_flat = Xest.reshape(-1)
+    mask_flat = mask.reshape(-1)
+
+    for i in numba.prange(X_flat.size):
+        if not mask_flat[i]:
+            X_flat[i] = Xest_flat[i]
+
+    return X
+
+
+@numba.jit(nopython=True, cache=True, parallel=USE_PARALLEL,
+           fastmath=FASTMATH, error_model="numpy")
+def _residual_norm(X, Xest):
+    """Computes norm of X - Xest, without forming the difference."""
+
+    X_flat = X.reshape(-1)
+    Xest_flat = Xest.reshape(-1)
+    size = X_flat.size
+
+    # Split the sum into chunks, each accumulating its own partial sum.
+    n_chunks = min(N_CHUNKS, size)
+    partial = np.zeros(n_chunks)
+
+    for c in numba.prange(n_chunks):
+        for i in range((c * size) // n_chunks, ((c + 1) * size) // n_chunks):
+            d = X_flat[i] - Xest_flat[i]
+            partial[c] += d * d
+
+    resid = 0.0
+    for c in range(n_chunks):
+        resid += partial[c]
+
+    return np.sqrt(resid)
 
 
 @numba.jit(nopython=True, cache=True)
+def _component_shifts(u_s, v_s, out):
+    """Stores the outer sum of shift vectors, u_s[n] + v_s[k], in `out`."""
+    for n in range(u_s.size):
+        for k in range(v_s.size):
+            out[n, k] = u_s[n] + v_s[k]
+    return out
+
+
+@numba.jit(nopython=True, cache=True, fastmath=FASTMATH,
+           error_model="numpy")
 def _fit_shift(
-        Z, y, f, f_s, w, max_shift, periodic, n_iter, init_shift, Ww):
+        Z, y, f, f_s, w, max_shift, periodic, n_iter, init_shift,
+        Ww, work):
     """
-    Z   : matrix, M x T
-    y   : float
-    f   : vector, length M
-    f_s : vector, length M
-    w   : vector, length T
+    Z    : matrix, M x T
+    y    : float
+    f    : vector, length M
+    f_s  : vector, length M
+    w    : vector, length T
+    Ww   : scratch matrix, n_iter x T, same dtype as w
+    work : scratch matrix, 3 x n_iter
     """
 
     M, T = Z.shape
-    best_loss = np.inf
-    best_shift = 0.0
+    shifts, shifts_m, losses = work[0], work[1], work[2]
 
+    # Sample all candidate shifts up front, starting from the current one.
     for i in range(n_iter):
-
-        # Sample new shift.
         if i == 0:
-            s = init_shift
+            shifts[i] = init_shift
         else:
-            s = npr.uniform(-max_shift, max_shift)
+            shifts[i] = npr.uniform(-max_shift, max_shift)
+
+    # Ww holds w shifted by every candidate, for the m-th element. Dot
+    # products below are accumulated in the precision of Z and w.
+    zero = Z.dtype.type(0)
+
+    # Accumulate the loss of all candidates at once. The squared norm of
+    # Z does not depend on the shift, so it is left out of the loss.
+    losses.fill(0.0)
+    for m in range(M):
+
+        # Apply all candidate shifts for m-th element.
+        for i in range(n_iter):
+            shifts_m[i] = shifts[i] + f_s[m]
+        if periodic:
+            periodic_shifts.apply_shift_batch(w, shifts_m, Ww)
+        else:
+            padded_shifts.apply_shift_batch(w, shifts_m, Ww)
 
-        # Apply shifts.
-        loss = 0.0
-        for m in range(M):
+        # Compute loss for m-th element, expanding the squared norm
+        # of the residual, Z[m] - yf * Ww[i], into dot products.
+        yf = y * f[m]
+        _candidate_losses(Z[m], Ww, yf, zero, losses)
 
-            # Apply shift for m-th element.
-            if periodic:
-                periodic_shifts.apply_shift(w, s + f_s[m], Ww)
-            else:
-                padded_shifts.apply_shift(w, s + f_s[m], Ww)
-
-            # Compute loss for m-th element.
-            yf = y * f[m]
-            for t in range(T):
-                resid = Z[m, t] - (yf * Ww[t])
-                loss += resid * resid
+    # Find best shift.
+    best_loss = np.inf
+    best_shift = 0.0
+    for i in range(n_iter):
+        if losses[i] < best_loss:
+            best_shift = shifts[i]
+            best_loss = losses[i]
 
-            # Can stop early due to nonnegative loss.
-            if loss > best_loss:
-                break
+    return best_shift
 
-        # Save best loss.
-        if loss < best_loss:
-            best_shift = s
-            best_loss = loss
 
-    return best_shift
+@numba.jit(nopython=True, cache=True, fastmath=FASTMATH,
+           error_model="numpy")
+def _candidate_losses(z, Ww, yf, zero, losses):
+    """
+    Adds yf**2 * (Ww[i] @ Ww[i]) - 2 * yf * (z @ Ww[i]) to losses[i] for
+    every candidate i.
+    """
 
-@numba.jit(nopython=True, cache=True)
+    n_iter, T = Ww.shape
+
+    # Candidates are taken four at a time, so every element of z is loaded
+    # once per block and the four pairs of independent accumulators can
+    # be kept in vector registers.
+    n_blocked = n_iter - (n_iter % 4)
+    for i in range(0, n_blocked, 4):
+        zw0, zw1, zw2, zw3 = zero, zero, zero, zero
+        ww0, ww1, ww2, ww3 = zero, zero, zero, zero
+        for t in range(T):
+            zt = z[t]
+            a0, a1 = Ww[i, t], Ww[i + 1, t]
+            a2, a3 = Ww[i + 2, t], Ww[i + 3, t]
+            zw0 += zt * a0
+            zw1 += zt * a1
+            zw2 += zt * a2
+            zw3 += zt * a3
+            ww0 += a0 * a0
+            ww1 += a1 * a1
+            ww2 += a2 * a2
+            ww3 += a3 * a3
+        losses[i] += yf * yf * ww0 - 2 * yf * zw0
+        losses[i + 1] += yf * yf * ww1 - 2 * yf * zw1
+        losses[i + 2] += yf * yf * ww2 - 2 * yf * zw2
+        losses[i + 3] += yf * yf * ww3 - 2 * yf * zw3
+
+    # Remaining candidates.
+    for i in range(n_blocked, n_iter):
+        zw, ww = zero, zero
+        for t in range(T):
+            zw += z[t] * Ww[i, t]
+            ww += Ww[i, t] * Ww[i, t]
+        losses[i] += yf * yf * ww - 2 * yf * zw
+
+    return losses
+
+
+@numba.jit(nopython=True, cache=True, fastmath=FASTMATH)
 def _prevent_zeros(x):
     for xi in x:
         if abs(xi) > 1e-9:
             return None
-    x[:] = np.random.rand(x.size)
+    for i in range(x.size):
+        x[i] = np.random.rand()
@@ -40,6 +40,31 @@ def test_shifts_2d(shift):
     np.testing.assert_allclose(xs, np.column_stack((y, y)))
 
 
+def test_shifts_batch():
+    x = np.array([1, 2, 3, 4, 5], dtype="float")
+    shifts = np.array([-1.5, -0.25, 0.0, 0.7, 2.0])
+    xs = np.empty((shifts.size, x.size))
+
+    padded_shifts.apply_shift_batch(x, shifts, xs)
+    for j in range(shifts.size):
+        wx = [i - shifts[j] for i in range(5)]
+        np.testing.assert_allclose(
+            xs[j], np.interp(wx, np.arange(5), x))
+
+
+@pytest.mark.parametrize(
+    "shift", [-7.5, -2.3, -1.0, -0.4, 0.0, 0.4, 1.0, 2.3, 7.5]
+)
+def test_shift_dots(shift):
+    rs = np.random.RandomState(123)
+    x, y = rs.randn(2, 20)
+    xs = padded_shifts.apply_shift(x, shift, np.empty_like(x))
+
+    xy, xx = padded_shifts.shift_dots(x, shift, y)
+    np.testing.assert_allclose(xy, xs @ y)
+    np.testing.assert_allclose(xx, xs @ xs)
+
+
 def test_transpose_shifts():
     x = np.array([1, 2, 3, 4, 5], dtype="float")
     xs = np.empty_like(x)
@@ -215,6 +240,23 @@ def test_grams():
         np.testing.assert_allclose(actual, expected)
 
 
+@pytest.mark.parametrize("T", [1, 2, 5, 50])
+def test_weighted_grams(T):
+    rs = np.random.RandomState(123)
+    shifts = np.concatenate((
+        rs.uniform(-T - 2, T + 2, 100),
+        [0.0, 1.0, -1.0, T - 1.0, 1.0 - T]))
+    weights = rs.rand(shifts.size)
+
+    expected = np.zeros((2, T))
+    for shift, a in zip(shifts, weights):
+        expected += a * padded_shifts.shift_gram(shift, T, np.empty((2, T)))
+
+    actual = padded_shifts.weighted_shift_gram(
+        shifts, weights, T, np.empty((2, T)))
+    np.testing.assert_allclose(actual, expected, atol=1e-10)
+
+
 def test_sym_bmat_mul():
     S = np.array([
         [1, 2, 1, 0, 0, 0, 0, 0],
@@ -0,0 +1,74 @@
+"""
+Test shifted CP decomposition with shifts along axis=0 and axis=1.
+"""
+
+import pytest
+import numpy as np
+from scipy.ndimage import gaussian_filter1d
+from tensortools.cpwarp import ShiftedCP, fit_shifted_cp
+from tensortools.cpwarp import shift_cp2
+
+
+def _random_model(rank, shape, boundary, seed=123):
+    I, J, K = shape
+    rs = np.random.RandomState(seed)
+    u = rs.exponential(1.0, size=(rank, I))
+    v = rs.exponential(1.0, size=(rank, J))
+    w = gaussian_filter1d(rs.exponential(1.0, size=(rank, K)), 3, axis=-1)
+    u_s = rs.uniform(-.1 * K, .1 * K, (rank, I))
+    v_s = rs.uniform(-.1 * K, .1 * K, (rank, J))
+    return ShiftedCP(u, v, w, u_s, v_s, boundary=boundary)
+
+
+@pytest.mark.parametrize("periodic", [True, False])
+def test_predict_one(periodic):
+    model = _random_model(3, (9, 10, 30), "wrap" if periodic else "edge")
+    u, v, w = model.factors
+
+    expected = shift_cp2.predict(
+        u, v, w, model.u_s, model.v_s, periodic,
+        np.empty(model.shape), skip_dim=-1)
+
+    wshift_bufs = np.empty((shift_cp2.N_CHUNKS, model.shape[-1]))
+    actual = np.zeros(model.shape)
+    for r in range(model.rank):
+        shift_cp2._predict_one(
+            r, u, v, w, model.u_s, model.v_s, periodic, 1.0,
+            actual, wshift_bufs)
+    np.testing.assert_allclose(actual, expected)
+
+    # Subtracting every component leaves nothing behind.
+    for r in range(model.rank):
+        shift_cp2._predict_one(
+            r, u, v, w, model.u_s, model.v_s, periodic, -1.0,
+            actual, wshift_bufs)
+    np.testing.assert_allclose(actual, 0.0, atol=1e-12)
+
+
+@pytest.mark.parametrize("n_iter", [1, 4, 7])
+def test_candidate_losses(n_iter):
+    rs = np.random.RandomState(0)
+    z = rs.randn(30)
+    Ww = rs.randn(n_iter, 30)
+    yf = 1.7
+
+    expected = yf * yf * np.sum(Ww * Ww, axis=1) - 2 * yf * (Ww @ z)
+    actual = shift_cp2._candidate_losses(z, Ww, yf, 0.0, np.zeros(n_iter))
+
+    np.testing.assert_allclose(actual, expected)
+
+
+@pytest.mark.parametrize("boundary", ["wrap", "edge"])
+@pytest.mark.parametrize("masked", [False, True])
+def test_fit(boundary, masked):
+    model = _random_model(2, (20, 21, 40), boundary)
+    X = model.predict()
+
+    np.random.seed(0)
+    mask = np.random.rand(*X.shape) > .1 if masked else None
+    result = fit_shifted_cp(
+        X, 2, boundary=boundary, max_shift_axis0=.1,
+        max_shift_axis1=.1, max_iter=30, mask=mask)
+
+    assert result.loss_hist[-1] < result.loss_hist[0]
+    assert result.loss_hist[-1] < 0.2
@@ -5,8 +5,17 @@ Some of these functions were ported with minor modifications
 from the tensorly package, https://tensorly.github.io/, distributed
 under a BSD clause 3 license.
 """
+import numba
 import numpy as np
 
+# Largest Khatri-Rao product, in elements, that mttkrp always forms.
+KRP_MAX_SIZE = 2 ** 22
+
+# Number of partial sums used by _mttkrp. Fixing this, rather than using
+# the number of threads, keeps results independent of the thread count
+# and lets numba cache the compiled kernel.
+N_CHUNKS = 32
+
 
 def unfold(tensor, mode):
     """Returns the mode-`mode` unfolding of `tensor`.
@@ -56,3 +65,128 @@ def khatri_rao(matrices):
     source = ','.join(i+common_dim for i in target)
     operation = source+'->'+target+common_dim
     return np.einsum(operation, *matrices).reshape((-1, n_columns))
+
+
+def mttkrp(tensor, factors, mode):
+    """Matricized tensor times Khatri-Rao product.
+
+    Computes ``unfold(tensor, mode) @ khatri_rao(components)``, where
+    ``components`` holds every factor matrix except ``factors[mode]``.
+    The Khatri-Rao product is formed and multiplied by BLAS, unless it is
+    both larger than the tensor and larger than ``KRP_MAX_SIZE`` elements.
+    In that case, its rows are generated in small blocks from partial
+    Hadamard products, so that neither it nor the unfolded tensor is
+    stored, which trades some speed for memory.
+
+    Parameters
+    ----------
+    tensor : ndarray
+    factors : list of ndarray
+        Factor matrices, one per tensor mode. ``factors[mode]`` is
+        not used.
+    mode : int
+
+    Returns
+    -------
+    ndarray
+        matrix of shape ``(tensor.shape[mode], rank)``
+    """
+    components = [f for j, f in enumerate(factors) if j != mode]
+    rank = factors[mode].shape[1]
+    krp_size = (tensor.size // tensor.shape[mode]) * rank
+
+    if krp_size <= max(tensor.size, KRP_MAX_SIZE):
+        return unfold(tensor, mode) @ khatri_rao(components)
+
+    # View the tensor as (A, I, B), where I is the size of `mode`. Column
+    # a * B + b of the unfolding is then tensor[a, :, b].
+    dtype = np.result_type(tensor, *components)
+    tensor = np.ascontiguousarray(tensor, dtype=dtype)
+    I = tensor.shape[mode]
+    J = tensor.size // I
+    B = int(np.prod(tensor.shape[mode + 1:]))
+
+    return _mttkrp(
+        tensor.reshape((J // B, I, B)),
+        tuple([np.ascontiguousarray(f, dtype=dtype) for f in components]),
+        min(N_CHUNKS, J))
+
+
+@numba.jit(nopython=True, cache=True, parallel=True)
+def _mttkrp(X, components, n_chunks, block_size=64):
+
+    A, I, B = X.shape
+    J = A * B
+    Z = len(components)
+    rank = components[0].shape[1]
+
+    # Dimensions of the Khatri-Rao product, the last varies fastest.
+    dims = np.empty(Z, dtype=np.int64)
+    for z in range(Z):
+        dims[z] = components[z].shape[0]
+
+    # Split rows of the Khatri-Rao product into chunks, each accumulating
+    # into its own copy of the result.
+    partial = np.zeros((n_chunks, I, rank), dtype=X.dtype)
+
+    for c in numba.prange(n_chunks):
+        j_start = (c * J) // n_chunks
+        j_stop = ((c + 1) * J) // n_chunks
+
+        # idx holds the multi-index of the current row and P[z] holds
+        # components[0][idx[0]] * ... * components[z][idx[z]].
+        idx = np.empty(Z, dtype=np.int64)
+        P = np.empty((Z, rank), dtype=X.dtype)
+        krp = np.empty((block_size, rank), dtype=X.dtype)
+
+        rem = j_start
+        for z in range(Z - 1, -1, -1):
+            idx[z] = rem % dims[z]
+            rem //= dims[z]
+        first = 0
+
+        j0 = j_start
+        while j0 < j_stop:
+
+            # Blocks do not straddle slices of X, so that X[a, i, b0:b1]
+            # is contiguous.
+            a, b0 = j0 // B, j0 % B
+            j1 = min(j0 + block_size, j_stop, (a + 1) * B)
+            b1 = b0 + j1 - j0
+
+            for b in range(j1 - j0):
+
+                # Recompute only the partial products that changed.
+                for z in range(first, Z):
+                    if z == 0:
+                        for q in range(rank):
+                            P[0, q] = components[0][idx[0], q]
+                    else:
+                        for q in range(rank):
+                            P[z, q] = P[z - 1, q] * components[z][idx[z], q]
+                for q in range(rank):
+                    krp[b, q] = P[Z - 1, q]
+
+                # Advance the multi-index.
+                first = Z - 1
+                idx[first] += 1
+                while idx[first] == dims[first] and first > 0:
+                    idx[first] = 0
+                    first -= 1
+                    idx[first] += 1
+
+            for i in range(I):
+                for b in range(b0, b1):
+                    x = X[a, i, b]
+                    for q in range(rank):
+                        partial[c, i, q] += x * krp[b - b0, q]
+
+            j0 = j1
+
+    result = np.zeros((I, rank), dtype=X.dtype)
+    for c in range(n_chunks):
+        for i in range(I):
+            for q in range(rank):
+                result[i, q] += partial[c, i, q]
+
+    return result
@@ -7,7 +7,7 @@ Author: N. Benjamin Erichson <erichson@uw.edu> and Alex H. Williams
 import numpy as np
 import scipy.linalg
 
-from tensortools.operations import unfold, khatri_rao
+from tensortools.operations import mttkrp
 from tensortools.tensors import KTensor
 from tensortools.optimize import FitResult, optim_utils
 
@@ -118,14 +118,13 @@ def cp_als(X, rank, random_state=None, init='randn', skip_modes=[], **options):
             components = [U[j] for j in range(X.ndim) if j != n]
             grams = np.prod([u.T @ u for u in components], axis=0)
 
-            # iii)  Compute Khatri-Rao product.
-            kr = khatri_rao(components)
+            # iii) Compute unfolded tensor times Khatri-Rao product.
+            p = mttkrp(X, U.factors, n)
 
             # iv) Form normal equations and solve via Cholesky
             c = scipy.linalg.cho_factor(grams, overwrite_a=False)
-            p = unfold(X, n).dot(kr)
             U[n] = scipy.linalg.cho_solve(c, p.T, overwrite_b=False).T
-            # U[n] = np.linalg.solve(grams, unfold(X, n).dot(kr).T).T
+            # U[n] = np.linalg.solve(grams, p.T).T
 
         # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
         # Update the optimization result, checks for convergence.
@@ -6,7 +6,7 @@ Author: N. Benjamin Erichson <erichson@uw.edu> and Alex H. Williams
 
 import numpy as np
 
-from tensortools.operations import unfold, khatri_rao
+from tensortools.operations import mttkrp
 from tensortools.tensors import KTensor
 from tensortools.optimize import FitResult, optim_utils
 
@@ -131,9 +131,8 @@ def ncp_bcd(
             L0 = L  # Lipschitz constants
             L[n] = np.linalg.norm(grams, 2)
 
-            # ii)  Compute Khatri-Rao product
-            kr = khatri_rao(components)
-            p = unfold(X, n).dot(kr)
+            # ii)  Compute unfolded tensor times Khatri-Rao product
+            p = mttkrp(X, U.factors, n)
 
             # Compute Gradient.
             grad = Um[n].dot(grams) - p
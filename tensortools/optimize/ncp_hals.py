@@ -7,7 +7,7 @@ Author: N. Benjamin Erichson <erichson@uw.edu>
 import numpy as np
 import numba
 
-from tensortools.operations import unfold, khatri_rao
+from tensortools.operations import mttkrp
 from tensortools.tensors import KTensor
 from tensortools.optimize import FitResult, optim_utils
 
@@ -130,9 +130,8 @@ def ncp_hals(
             # i) compute the N-1 gram matrices
             grams = np.prod([arr.T @ arr for arr in components], axis=0)
 
-            # ii)  Compute Khatri-Rao product
-            kr = khatri_rao(components)
-            Xmkr = unfold(X, n).dot(kr)
+            # ii)  Compute unfolded tensor times Khatri-Rao product
+            Xmkr = mttkrp(X, U.factors, n)
 
             # iii) Update component U_n
             _hals_update(U[n], grams, Xmkr, n not in negative_modes)
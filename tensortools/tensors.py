@@ -41,10 +41,28 @@ class KTensor(object):
         """Converts KTensor to a dense ndarray."""
 
         # Compute tensor unfolding along first mode
-        unf = self.factors[0] @ khatri_rao(self.factors[1:]).T
-
-        # Inverse unfolding along first mode
-        return np.reshape(unf, self.shape)
+        if self.ndim < 3:
+            unf = self.factors[0] @ khatri_rao(self.factors[1:]).T
+            return np.reshape(unf, self.shape)
+
+        # Otherwise, fill the output in blocks along the first mode. Each
+        # block, unfolded along the last mode, is a block of the Khatri-Rao
+        # product of all but the last factor times factors[-1].T. Only the
+        # Khatri-Rao product of the middle factors and one block of rows
+        # are held in memory besides the output.
+        first, last = self.factors[0], self.factors[-1]
+        middle = khatri_rao(self.factors[1:-1])
+        out = np.empty(self.shape, dtype=np.result_type(*self.factors))
+
+        block_size = max(1, 512 // middle.shape[0])
+        for i0 in range(0, self.shape[0], block_size):
+            i1 = min(i0 + block_size, self.shape[0])
+            krp = first[i0:i1, None, :] * middle[None, :, :]
+            np.matmul(
+                krp.reshape(-1, self.rank), last.T,
+                out=out[i0:i1].reshape(-1, self.shape[-1]))
+
+        return out
 
     def norm(self):
         """Efficiently computes Frobenius-like norm of the tensor."""
@@ -54,8 +72,10 @@ class KTensor(object):
     def rebalance(self):
         """Rescales factors across modes so that all norms match."""
 
-        # Compute norms along columns for each factor matrix
-        norms = [np.linalg.norm(f, axis=0) for f in self.factors]
+        # Compute norms along columns for each factor matrix, flooring
+        # them so that all-zero components do not produce nans.
+        norms = [np.maximum(np.linalg.norm(f, axis=0), 1e-20)
+                 for f in self.factors]
 
         # Multiply norms across all modes
         lam = np.prod(norms, axis=0) ** (1/self.ndim)
@@ -2,7 +2,8 @@
 import pytest
 import numpy as np
 
-from tensortools.operations import khatri_rao
+from tensortools import operations
+from tensortools.operations import khatri_rao, mttkrp, unfold
 
 atol_float32 = 1e-4
 atol_float64 = 1e-8
@@ -34,3 +35,19 @@ def test_khatrirao():
     ])
 
     assert np.allclose(khatri_rao((A, B)), C, atol_float64)
+
+
+@pytest.mark.parametrize("shape", [(10, 11, 12), (5, 6, 7, 300)])
+@pytest.mark.parametrize("rank", [4, 20])
+@pytest.mark.parametrize("krp_max_size", [0, 2 ** 22])
+def test_mttkrp(shape, rank, krp_max_size, monkeypatch):
+    monkeypatch.setattr(operations, "KRP_MAX_SIZE", krp_max_size)
+    rs = np.random.RandomState(123)
+    X = rs.randn(*shape)
+    factors = [rs.randn(s, rank) for s in shape]
+
+    for n in range(X.ndim):
+        components = [f for j, f in enumerate(factors) if j != n]
+        expected = unfold(X, n) @ khatri_rao(components)
+        assert np.allclose(
+            mttkrp(X, factors, n), expected, atol=atol_float64)
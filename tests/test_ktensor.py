@@ -4,6 +4,7 @@ import numpy as np
 from numpy.testing import assert_almost_equal
 
 from tensortools import KTensor
+from tensortools.operations import khatri_rao, unfold
 
 
 def test_norm():
@@ -12,3 +13,28 @@ def test_norm():
     U = KTensor([rs.randn(55, 3) for _ in range(3)])
 
     assert_almost_equal(U.norm(), np.linalg.norm(U.full()))
+
+
+def test_rebalance():
+
+    rs = np.random.RandomState(123)
+    U = KTensor([rs.randn(55, 3) for _ in range(3)])
+    U.factors[1][:, 2] = 0.0
+    X = U.full()
+
+    U.rebalance()
+    norms = np.column_stack([np.linalg.norm(f, axis=0) for f in U.factors])
+
+    assert np.all(np.isfinite(norms))
+    assert_almost_equal(norms[:2], norms[:2, [0]] * np.ones((2, 3)))
+    assert_almost_equal(U.full(), X)
+
+
+@pytest.mark.parametrize("shape", [(6, 7), (6, 7, 8, 9), (600, 2, 3)])
+def test_full(shape):
+
+    rs = np.random.RandomState(123)
+    U = KTensor([rs.randn(n, 3) for n in shape])
+
+    expected = U.factors[0] @ khatri_rao(U.factors[1:]).T
+    assert_almost_equal(unfold(U.full(), 0), expected)